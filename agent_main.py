@@ -1,42 +1,125 @@
 import os
+import re
 import json
+import asyncio
+import functools
 from typing import Dict, List
-from openai import OpenAI
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
 from dotenv import load_dotenv
-from agents import Agent, Runner, function_tool
+from agents import Agent, ModelSettings, OpenAIResponsesModel, Runner, function_tool
 from tools import DockingTool, KnowledgeTool
 
+# Compact JSON keeps tool output (and the LLM context it lands in) small
+try:
+    import orjson
+
+    def _to_json(obj):
+        return orjson.dumps(obj).decode()
+except ImportError:
+    def _to_json(obj):
+        return json.dumps(obj, separators=(",", ":"))
+
 load_dotenv()
 
+# Upper bound on agent runs talking to the API at the same time
+MAX_CONCURRENT_QUERIES = int(os.getenv("MAX_CONCURRENT_QUERIES", "8"))
+
+# Optional surrogate model (saved with joblib) that triages molecules before
+# docking; only those predicted below the threshold (kcal/mol) are docked
+DOCKING_SURROGATE = os.getenv("DOCKING_SURROGATE") or None
+DOCKING_TRIAGE_THRESHOLD = float(os.getenv("DOCKING_TRIAGE_THRESHOLD", "-6.0"))
+
+@functools.lru_cache(maxsize=None)
+def _openai_client():
+    """
+    OpenAI client shared across agents and requests so the HTTP connection
+    pool is reused. Created on first use, importing this module needs no API key.
+    """
+    return AsyncOpenAI(
+        http_client=DefaultAsyncHttpxClient(
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20)
+        )
+    )
+
+# Tools are shared by every tool call so their caches stay warm in memory
+_knowledge = KnowledgeTool()
+
+@functools.lru_cache(maxsize=None)
+def _docking_tool():
+    """Shared DockingTool, created on first use so importing this module opens no database"""
+    return DockingTool(surrogate=DOCKING_SURROGATE, triage_threshold=DOCKING_TRIAGE_THRESHOLD)
+
+_QUOTED = re.compile(r'"([^"]+)"')
+_TARGET = re.compile(r'\btarget\s+"([A-Za-z0-9_]+)"', re.IGNORECASE)
+_WORDS = re.compile(r'[A-Za-z0-9_]+')
+_SMILES_CHARS = re.compile(r'^[A-Za-z0-9@+\-\[\]\(\)=#/\\.%]+$')
+
+def parse_query(query: str):
+    """
+    Extract quoted SMILES and the protein target from a query without the LLM.
+    
+    Returns (smiles_list, target). The list is empty and/or the target is
+    None when the query does not spell them out unambiguously, including
+    when it names more than one target.
+    """
+    # Knowledge base ids only match as written, so English words ("ache") never do
+    known = set(_knowledge.get_target_ids())
+    targets = {word for word in _WORDS.findall(query) if word in known}
+    if not targets:
+        # Targets outside the knowledge base only when quoted after "target": target "X"
+        targets = {name.upper() for name in _TARGET.findall(query)}
+    target = targets.pop() if len(targets) == 1 else None
+    
+    smiles_list = []
+    for token in _QUOTED.findall(query):
+        token = token.strip()
+        if token.upper() == target:
+            continue
+        if not _SMILES_CHARS.match(token) or not DockingTool.is_valid_smiles(token):
+            # Something quoted that is neither the target nor a molecule
+            return [], target
+        smiles_list.append(token)
+    
+    return smiles_list, target
+
 @function_tool
-def compute_docking_scores(molecules: str, target: str) -> str:
-    """Compute docking scores for molecules against a target protein. Input molecules as comma-separated SMILES."""
-    docking_tool = DockingTool()
-    molecule_list = [mol.strip() for mol in molecules.split(',')]
-    scores = docking_tool.compute_scores(molecule_list, target_name=target)
-    return json.dumps(scores, indent=2)
+async def compute_docking_scores(molecules: str, target: str) -> str:
+    """Compute docking scores for molecules against a target protein. Input molecules as comma-separated SMILES. Scores predicted by the surrogate model instead of docked are listed under "estimated"."""
+    molecule_iter = (mol.strip() for mol in molecules.split(','))
+    estimated = set()
+    # Docking is blocking work, keep it off the event loop so parallel tool calls overlap
+    scores = await asyncio.to_thread(
+        lambda: dict(_docking_tool().compute_scores_iter(molecule_iter, target_name=target, estimated=estimated))
+    )
+    return _scores_json(scores, estimated)
+
+def _scores_json(scores, estimated):
+    """Scores as JSON, with surrogate estimates flagged so they are not mistaken for docking results"""
+    if not estimated:
+        return _to_json(scores)
+    return _to_json({"scores": scores, "estimated": [smi for smi in scores if smi in estimated]})
 
 @function_tool
 def get_knowledge_response(question: str) -> str:
     """Get knowledge-based response about molecular docking, targets, or processes."""
-    knowledge_tool = KnowledgeTool()
-    return knowledge_tool.answer_general_question(question)
+    return _knowledge.answer_general_question(question)
 
 @function_tool
 def get_target_info(target_id: str) -> str:
     """Get detailed information about a protein target."""
-    knowledge_tool = KnowledgeTool()
-    info = knowledge_tool.get_target_info(target_id)
-    return json.dumps(info, indent=2)
+    info = _knowledge.get_target_info(target_id)
+    return _to_json(info)
 
 @function_tool
 def analyze_docking_results(scores_json: str, target: str) -> str:
     """Analyze docking results and provide insights. Input scores as JSON string."""
-    knowledge_tool = KnowledgeTool()
     try:
         results = json.loads(scores_json)
-        insights = knowledge_tool.get_analysis_insights(results, target)
-        return "\n".join(insights)
+        if isinstance(results, dict) and isinstance(results.get("scores"), dict):
+            # compute_docking_scores output with flagged surrogate estimates
+            results = results["scores"]
+        return _knowledge.get_analysis_insights(results, target)
     except json.JSONDecodeError:
         return "Error: Invalid JSON format for scores"
 
@@ -44,7 +127,8 @@ class MolecularAgent:
     """Agent for molecular docking and analysis using OpenAI Agents SDK"""
     
     def __init__(self):
-        self.client = OpenAI()
+        self.client = _openai_client()
+        self._sem = asyncio.Semaphore(MAX_CONCURRENT_QUERIES)
         
         self.agent = Agent(
             name="Molecular Docking Expert",
@@ -67,7 +151,7 @@ Key knowledge about docking scores:
 - Differences of 1-2 kcal/mol can be significant (10-fold difference in binding)
 
 When processing queries:
-1. Extract molecules (SMILES) and target from the query
+1. Extract molecules (SMILES) and target from the query; if docking scores are already provided with the query, use them instead of computing them again
 2. Check cache for existing scores first
 3. Compute missing scores if needed
 4. Analyze and interpret results
@@ -81,16 +165,28 @@ Always provide clear, scientific explanations and practical implications.""",
                 get_target_info,
                 analyze_docking_results
             ],
-            model="gpt-4.1-nano"
+            model=OpenAIResponsesModel(model="gpt-4.1-nano", openai_client=self.client),
+            model_settings=ModelSettings(parallel_tool_calls=True)
         )
     
-    def process_query(self, query: str) -> str:
+    async def process_query(self, query: str) -> str:
         """Process user queries through the OpenAI Agents SDK"""
         
         print(f"Processing query: {query}")
         
         try:
-            result = Runner.run_sync(self.agent, query)
+            # Dock up front when the query names molecules and target explicitly,
+            # saving the model a tool-call round trip
+            # Off the event loop: the first call imports RDKit and loads the knowledge base
+            smiles_list, target = await asyncio.to_thread(parse_query, query)
+            # Only pre-dock against a target that really docks, never pre-fill mock scores
+            if smiles_list and target and await asyncio.to_thread(lambda: _docking_tool().can_dock(target)):
+                estimated = set()
+                scores = await asyncio.to_thread(_docking_tool().compute_scores, smiles_list, target, estimated)
+                query = f"{query}\n\nDocking scores against {target} (kcal/mol), already computed: {_scores_json(scores, estimated)}"
+            
+            async with self._sem:
+                result = await Runner.run(self.agent, query)
             return result.final_output
             
         except Exception as e:
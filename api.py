@@ -1,44 +1,25 @@
-from flask import Flask, request, jsonify, send_from_directory
-from flask_cors import CORS
+from quart import Quart, request, jsonify, send_from_directory
+from quart_cors import cors
 import json
-import asyncio
-import threading
 import os
 from agent_main import MolecularAgent
 
-app = Flask(__name__, static_folder='static')
-CORS(app)  
+app = Quart(__name__, static_folder='static')
+app = cors(app)
 
 agent = MolecularAgent()
 
-def run_in_thread(query):
-    """Run the agent query in a separate thread with its own event loop"""
-    def run_query():
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            return agent.process_query(query)
-        finally:
-            loop.close()
-    
-    # Run in thread
-    result = [None]
-    thread = threading.Thread(target=lambda: result.__setitem__(0, run_query()))
-    thread.start()
-    thread.join()
-    return result[0]
-
 @app.route('/api/query', methods=['POST'])
-def process_query():
+async def process_query():
     """Process user queries through the molecular agent"""
     try:
-        data = request.get_json()
+        data = await request.get_json()
         query = data.get('query', '')
         
         if not query:
             return jsonify({'error': 'No query provided'}), 400
         
-        response = run_in_thread(query)
+        response = await agent.process_query(query)
         
         return jsonify({
             'response': response,
@@ -53,19 +34,19 @@ def process_query():
         }), 500
 
 @app.route('/api/health', methods=['GET'])
-def health_check():
+async def health_check():
     """Health check endpoint"""
     return jsonify({'status': 'healthy', 'message': 'Molecular Agent API is running'})
 
 @app.route('/')
-def serve_frontend():
+async def serve_frontend():
     """Serve the main frontend page"""
-    return send_from_directory(app.static_folder, 'index.html')
+    return await send_from_directory(app.static_folder, 'index.html')
 
 @app.route('/<path:filename>')
-def serve_static(filename):
+async def serve_static(filename):
     """Serve static files"""
-    return send_from_directory(app.static_folder, filename)
+    return await send_from_directory(app.static_folder, filename)
 
 if __name__ == '__main__':
     print("Starting Molecular Agent API...")
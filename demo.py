@@ -1,6 +1,7 @@
+import asyncio
 from agent_main import MolecularAgent
 
-def main():    
+async def main():    
     print("🧬 Molecular Agent Demo (OpenAI Agents SDK)")
     print("=" * 50)
     
@@ -20,7 +21,7 @@ def main():
         print("-" * 50)
         
         try:
-            response = agent.process_query(query)
+            response = await agent.process_query(query)
             print(response)
         except Exception as e:
             print(f"❌ Error: {e}")
@@ -32,4 +33,4 @@ def main():
     print("Then visit: http://localhost:5000/api/health")
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())
@@ -1,49 +1,231 @@
 """
 Test script for individual tools
 """
+import asyncio
+import json
+import os
+import sqlite3
+import tempfile
 
 def test_docking_tool():
     """Test the DockingTool"""
     print("🧬 Testing DockingTool...")
     from tools import DockingTool
     
-    docking_tool = DockingTool()
+    # A temporary database and seed file, so the test never writes data/docking_scores.db
+    with tempfile.TemporaryDirectory() as tmp:
+        db_file = os.path.join(tmp, "docking_scores.db")
+        seed_file = os.path.join(tmp, "docking_scores.json")
+        with open(seed_file, "w") as f:
+            json.dump({"ACHE": {"OCC": -5.5}}, f)
+        
+        docking_tool = DockingTool(db_file=db_file, seed_file=seed_file)
+        
+        molecules = ["CCO"]
+        target = "ACHE"
+        
+        print(f"Computing scores for {molecules} against {target}")
+        scores = docking_tool.compute_scores(molecules, target)
+        print(f"Results: {scores}")
+        # seeded as "OCC", found under the canonical form shared with "CCO"
+        assert scores == {"CCO": -5.5}
+        
+        print("\nTesting cache hit (should be faster)...")
+        scores2 = docking_tool.compute_scores(molecules, target)
+        print(f"Cached results: {scores2}")
+        assert scores2 == scores
+        
+        print("\nTesting cache lookups...")
+        cached = docking_tool.get_cached_scores(["OCC", "CCCCCC", "not_a_smiles"], target)
+        print(f"Cached scores: {cached}")
+        assert cached == {"OCC": -5.5}
+        # "OCC" and "CCO" are one molecule, so one of two unique molecules is cached
+        assert docking_tool.get_cache_hit_rate(["OCC", "CCO", "CCCCCC"], target) == 0.5
+        assert docking_tool.get_cache_hit_rate(["not_a_smiles"], target) == 0.0
+        
+        print("\nTesting equivalent, duplicate and invalid SMILES...")
+        scores3 = docking_tool.compute_scores(["CCN", "NCC", "CCN", "not_a_smiles"], "F2")
+        print(f"Results: {scores3}")
+        assert list(scores3) == ["CCN", "NCC", "not_a_smiles"]
+        assert scores3["CCN"] is not None
+        assert scores3["CCN"] == scores3["NCC"]
+        assert scores3["not_a_smiles"] is None
+        with sqlite3.connect(db_file) as conn:
+            rows = conn.execute("SELECT smiles FROM scores WHERE target = 'F2'").fetchall()
+        assert rows == [("CCN",)]
+        
+        print("\nTesting streamed scores across chunk boundaries...")
+        stream = ["C", "CC", "CCC", "OCC", "CCCC"]
+        streamed = list(docking_tool.compute_scores_iter(stream, "F2", chunk=2))
+        print(f"Results: {streamed}")
+        assert [smi for smi, _ in streamed] == stream
+        assert dict(streamed) == docking_tool.compute_scores(stream, "F2")
+        
+        print("\nTesting surrogate triage...")
+        _test_surrogate_triage(db_file, seed_file)
     
-    molecules = ["CCO"]
-    target = "ACHE"
+    return scores
+
+class _StubTarget:
+    """Stands in for a dockstring target, every docked molecule scores -9.5"""
     
-    print(f"Computing scores for {molecules} against {target}")
-    scores = docking_tool.compute_scores(molecules, target)
-    print(f"Results: {scores}")
+    def dock(self, smiles, **kwargs):
+        return -9.5, None
+
+class _StubSurrogate:
+    """Predicts strong binding only for molecules with more than 4 fingerprint bits set"""
     
-    print("\nTesting cache hit (should be faster)...")
-    scores2 = docking_tool.compute_scores(molecules, target)
-    print(f"Cached results: {scores2}")
+    def predict(self, X):
+        return [-9.0 if bits > 4 else -2.0 for bits in X.sum(axis=1, dtype=int)]
+
+def _test_surrogate_triage(db_file, seed_file):
+    from tools import DockingTool, docking_tool as docking_module
     
-    return scores
+    # Stub dockstring, so the surrogate path runs without it
+    load_target = docking_module._dockstring_load_target
+    docking_module._dockstring_load_target = lambda: (lambda name: _StubTarget())
+    try:
+        docking_tool = DockingTool(db_file=db_file, seed_file=seed_file,
+                                   surrogate=_StubSurrogate(), triage_threshold=-6.0)
+        estimated = set()
+        scores = docking_tool.compute_scores(["C", "CCCCCCCCO"], "TRIAGE", estimated)
+        print(f"Results: {scores}, estimated: {estimated}")
+        assert scores == {"C": -2.0, "CCCCCCCCO": -9.5}
+        assert estimated == {"C"}
+        # only the docked score is cached, the estimate is not
+        assert docking_tool.get_cached_scores(["C", "CCCCCCCCO"], "TRIAGE") == {"CCCCCCCCO": -9.5}
+    finally:
+        docking_module._dockstring_load_target = load_target
+        docking_module._load_target_cached.cache_clear()
 
 def test_knowledge_tool():
     """Test the KnowledgeTool"""
     print("\n📚 Testing KnowledgeTool...")
-    from tools import KnowledgeTool
+    from tools import KnowledgeTool, ScoreInterpretation
     
     knowledge_tool = KnowledgeTool()
     
     print("Score interpretation for -7.5:")
     interpretation = knowledge_tool.get_score_interpretation(-7.5)
     print(interpretation)
+    assert isinstance(interpretation, ScoreInterpretation)
+    assert interpretation.score == -7.5
+    assert interpretation.category == "good"
+    
+    print("\nScore band boundaries, single and batch...")
+    boundaries = {-8.01: "excellent", -8.0: "good", -6.0: "moderate", -4.0: "weak", -1.0: "weak"}
+    batch = knowledge_tool.get_score_interpretations_batch(list(boundaries))
+    assert [i.category for i in batch] == list(boundaries.values())
+    assert batch == [knowledge_tool.get_score_interpretation(score) for score in boundaries]
     
     print("\nTarget info for F2:")
     target_info = knowledge_tool.get_target_info("F2")
     print(target_info)
+    assert target_info["target_id"] == "F2"
+    assert target_info["has_known_drugs"]
     
     print("\nAnswering general question:")
     answer = knowledge_tool.answer_general_question("What does a docking score of -7.5 mean?")
     print(answer)
+    # "docking" outranks "score"
+    assert answer.startswith("**Molecular Docking**")
+    
+    print("\nRouting with both keyword scanners...")
+    _test_routing()
+    
+    print("\nAnalysis insights...")
+    insights = knowledge_tool.get_analysis_insights({"CCO": -7.0, "CCN": -3.5, "CCC": None}, "F2")
+    print(insights)
+    assert isinstance(insights, str)
+    assert "Best binding: CCO (-7.0 kcal/mol)" in insights
+    assert "Average binding: -5.2 kcal/mol" in insights
+    # same rounding of the average as a plain sum() / len()
+    scores = dict(zip("abcdefgh", [-6.0, -8.0, -11.7, -6.0, -4.0, -8.0, -8.0, -8.7]))
+    assert "Average binding: -7.6 kcal/mol" in knowledge_tool.get_analysis_insights(scores)
+    
+    print("\nStreamed and full knowledge base loads...")
+    _test_section_loading()
+    
+    print("\nCompiled and NumPy analysis kernels...")
+    _test_kernels()
+
+def _test_routing():
+    from tools import knowledge_tool as knowledge_module
+    
+    routes = {
+        "what is molecular docking": "docking",
+        "docking score of -7.5": "docking",
+        "is a virtual screening score reliable": "virtual_screening",
+        "Drug Discovery timeline": "drug_discovery",
+        "how strong is this BINDING affinity": "scoring",
+        "hello": None,
+    }
+    router = knowledge_module._ROUTER
+    try:
+        for backend in (router, None):
+            # None is the regex fallback used without pyahocorasick
+            knowledge_module._ROUTER = backend
+            for question, category in routes.items():
+                assert knowledge_module._route(question.casefold()) == category, (backend, question)
+    finally:
+        knowledge_module._ROUTER = router
+
+def _test_section_loading():
+    from tools import KnowledgeTool, knowledge_tool as knowledge_module
+    
+    streamed = KnowledgeTool()
+    ijson = knowledge_module.ijson
+    knowledge_module.ijson = None
+    try:
+        # Without ijson every section comes from the full load
+        full = KnowledgeTool()
+        for section in ("docking_scores", "targets", "processes", "molecular_properties"):
+            assert streamed._load_section(section) == full._load_section(section), section
+        assert streamed._targets == full._targets
+    finally:
+        knowledge_module.ijson = ijson
+
+def _test_kernels():
+    import numpy as np
+    from tools import _knowledge_kernels
+    from tools.knowledge_tool import _BIN_EDGES
+    
+    scores = np.random.default_rng(0).uniform(-12.0, -2.0, _knowledge_kernels.COMPILED_MIN_SCORES)
+    expected = _knowledge_kernels._bucket_and_stats_numpy(scores, _BIN_EDGES)
+    # Above the cutoff bucket_and_stats uses the numba kernel when numba is installed
+    best, worst, best_idx, counts = _knowledge_kernels.bucket_and_stats(scores, _BIN_EDGES)
+    assert (best, worst, best_idx) == expected[:3]
+    assert counts.tolist() == expected[3].tolist()
+    assert sum(counts.tolist()) == len(scores)
+
+def test_parse_query():
+    """Test extracting molecules and target from a query"""
+    print("\n🔎 Testing parse_query...")
+    from agent_main import parse_query
+    
+    cases = [
+        ('Rank molecules "CCO", "CCN" by docking score against target "F2"', (["CCO", "CCN"], "F2")),
+        ('Dock "CCO" against ACHE', (["CCO"], "ACHE")),
+        ('Dock "CCO" into target "abl1"', (["CCO"], "ABL1")),
+        # ordinary English must not be read as a target
+        ('Dock "CCO" into my target of interest', (["CCO"], None)),
+        ('Dock "CCO" against something ache-related', (["CCO"], None)),
+        # more than one target is ambiguous, left to the model
+        ('Dock "CCO" against F2 and ACHE', (["CCO"], None)),
+        ('Dock "CCO" into target "ABL1" and target "KIT"', ([], None)),
+        ('What does a docking score of -7.5 mean?', ([], None)),
+    ]
+    for query, expected in cases:
+        parsed = parse_query(query)
+        print(f"{query!r} -> {parsed}")
+        assert parsed == expected, f"{query!r}: expected {expected}, got {parsed}"
 
 def test_agent():
     """Test the full agent"""
     print("\n🤖 Testing MolecularAgent...")
+    asyncio.run(_run_agent_queries())
+
+async def _run_agent_queries():
     from agent_main import MolecularAgent
     
     agent = MolecularAgent()
@@ -58,7 +240,7 @@ def test_agent():
         print(f"\n--- Test Query {i} ---")
         print(f"Query: {query}")
         try:
-            response = agent.process_query(query)
+            response = await agent.process_query(query)
             print(f"Response: {response}")
         except Exception as e:
             print(f"Error: {e}")
@@ -71,6 +253,7 @@ def main():
     try:
         test_docking_tool()
         test_knowledge_tool()
+        test_parse_query()
         
         print("\n" + "=" * 50)
         print("Testing full agent (requires OPENAI_API_KEY)...")
@@ -1,2 +1,2 @@
 from .docking_tool import DockingTool
-from .knowledge_tool import KnowledgeTool
+from .knowledge_tool import KnowledgeTool, ScoreInterpretation
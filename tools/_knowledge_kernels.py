@@ -0,0 +1,53 @@
+import functools
+
+import numpy as np
+
+# Below this many scores the NumPy path is used: it is within a fraction of a
+# millisecond of the compiled loop there, and never pays numba's import and
+# JIT compile (hundreds of ms) for the tens of scores a typical analysis sees
+COMPILED_MIN_SCORES = 100_000
+
+def _bucket_and_stats_loop(scores, thresholds):
+    """Single pass over the scores: min, argmin, max and per-band counts"""
+    counts = np.zeros(thresholds.shape[0] + 1, dtype=np.int64)
+    best = scores[0]
+    worst = scores[0]
+    best_idx = 0
+    for i in range(scores.shape[0]):
+        score = scores[i]
+        if score < best:
+            best = score
+            best_idx = i
+        if score > worst:
+            worst = score
+
+        band = 0
+        while band < thresholds.shape[0] and score >= thresholds[band]:
+            band += 1
+        counts[band] += 1
+    return best, worst, best_idx, counts
+
+def _bucket_and_stats_numpy(scores, thresholds):
+    """Same result as the compiled loop, from NumPy reductions"""
+    best_idx = int(scores.argmin())
+    counts = np.bincount(np.digitize(scores, thresholds), minlength=thresholds.shape[0] + 1)
+    return scores[best_idx], scores.max(), best_idx, counts
+
+@functools.lru_cache(maxsize=None)
+def _compiled_kernel():
+    """The numba-compiled loop, imported and compiled on first call; None without numba"""
+    try:
+        from numba import njit
+    except ImportError:
+        return None
+    # Not parallel: numba's prange has no argmin reduction, and one compiled
+    # pass is already memory bound for score arrays of any realistic size
+    return njit(cache=True, fastmath=True)(_bucket_and_stats_loop)
+
+def bucket_and_stats(scores, thresholds):
+    """Best, worst, index of the best and per-band counts of a float64 score array"""
+    if scores.shape[0] >= COMPILED_MIN_SCORES:
+        kernel = _compiled_kernel()
+        if kernel is not None:
+            return kernel(scores, thresholds)
+    return _bucket_and_stats_numpy(scores, thresholds)
@@ -1,119 +1,431 @@
 import os
 import json
-from rdkit import Chem
+import multiprocessing
+import sqlite3
+import functools
+import itertools
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from zlib import crc32
 
-# Try to import dockstring, fall back to mock if not available
 try:
-    from dockstring import load_target
-    DOCKSTRING_AVAILABLE = True
+    import orjson
 except ImportError:
-    DOCKSTRING_AVAILABLE = False
-    print("Warning: Dockstring not available, using mock scores")
+    orjson = None
+
+# RDKit and dockstring are heavy imports, load them on first use so processes
+# that never dock (health checks, knowledge questions) start quickly
+
+@functools.lru_cache(maxsize=None)
+def _rdkit():
+    """Return rdkit.Chem, importing it on first call"""
+    from rdkit import Chem
+    return Chem
+
+@functools.lru_cache(maxsize=None)
+def _dockstring_load_target():
+    """Return dockstring's load_target, or None to fall back to mock scores"""
+    try:
+        from dockstring import load_target
+    except ImportError:
+        print("Warning: Dockstring not available, using mock scores")
+        return None
+    return load_target
+
+def _parse_dock_result(result):
+    """Extract the score from the different return formats of dockstring"""
+    if isinstance(result, dict):
+        return result["score"]
+    if isinstance(result, tuple):
+        return result[0]
+    return float(result)
+
+@functools.lru_cache(maxsize=4096)
+def _mock_score(smiles):
+    """Mock scores are a pure function of the SMILES string"""
+    # crc32 is stable across processes, unlike hash() which is salted per run
+    hash_val = crc32(smiles.encode()) % 1000
+    score = -3.0 - (hash_val / 1000.0) * 9.0
+    return round(score, 1)
+
+@functools.lru_cache(maxsize=8192)
+def _canon(smiles):
+    """Canonical SMILES used as cache key, None if the SMILES is invalid"""
+    Chem = _rdkit()
+    mol = Chem.MolFromSmiles(smiles)
+    if mol is None:
+        return None
+    return Chem.MolToSmiles(mol)
+
+@functools.lru_cache(maxsize=4)
+def _load_surrogate(path):
+    """Load a pickled scikit-learn style regressor once per process"""
+    import joblib
+    return joblib.load(path)
+
+def _morgan_matrix(smiles_list, radius=2, n_bits=2048):
+    """Stack Morgan fingerprints of valid SMILES into an (n, n_bits) uint8 array"""
+    import numpy as np
+    from rdkit.Chem import rdFingerprintGenerator
+    
+    Chem = _rdkit()
+    generator = rdFingerprintGenerator.GetMorganGenerator(radius=radius, fpSize=n_bits)
+    X = np.zeros((len(smiles_list), n_bits), dtype=np.uint8)
+    for i, smi in enumerate(smiles_list):
+        X[i] = generator.GetFingerprintAsNumPy(Chem.MolFromSmiles(smi))
+    return X
+
+@functools.lru_cache(maxsize=16)
+def _load_target_cached(target_name):
+    """Load a dockstring target once per process"""
+    return _dockstring_load_target()(target_name)
+
+def _dock_one(args):
+    """
+    Dock one molecule in a worker process.
+    
+    Returns a (score, error) pair so a single failure does not abort the
+    whole batch. The target is loaded once per worker and reused.
+    """
+    target_name, smi = args
+    try:
+        target = _load_target_cached(target_name)
+        # One CPU per ligand, the pool provides the parallelism
+        return _parse_dock_result(target.dock(smi, num_cpus=1)), None
+    except Exception as e:
+        return None, str(e)
+
+def _dock_workers():
+    """
+    Number of docking processes this process may run.
+    
+    DOCKING_WORKERS when set, otherwise the cores split evenly between the
+    web server's worker processes (WEB_CONCURRENCY, 1 outside a server).
+    """
+    workers = os.getenv("DOCKING_WORKERS")
+    if workers:
+        return max(1, int(workers))
+    return max(1, (os.cpu_count() or 1) // max(1, int(os.getenv("WEB_CONCURRENCY", "1"))))
+
+# Docking worker pool shared by every DockingTool and request, created on
+# first use. Workers keep their loaded targets between batches.
+_DOCK_POOL = None
+_DOCK_POOL_LOCK = threading.Lock()
+
+def _dock_pool():
+    """Return the shared docking process pool, starting it on first call"""
+    global _DOCK_POOL
+    with _DOCK_POOL_LOCK:
+        if _DOCK_POOL is None:
+            # Never fork: the server process runs other threads (event loop,
+            # to_thread workers), and forking them can deadlock the child
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _DOCK_POOL = ProcessPoolExecutor(
+                max_workers=_dock_workers(),
+                mp_context=multiprocessing.get_context(method),
+            )
+        return _DOCK_POOL
+
+def _discard_dock_pool(pool):
+    """Drop a broken pool so the next batch starts a fresh one"""
+    global _DOCK_POOL
+    with _DOCK_POOL_LOCK:
+        if _DOCK_POOL is pool:
+            _DOCK_POOL = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+# In-process hot cache shared by all DockingTool instances:
+# db_file -> target -> {smiles: score}
+_SCORE_CACHE = {}
+
+# Serializes use of the shared SQLite connections and hot cache, tools are
+# shared across concurrent requests and docking runs in worker threads
+_CACHE_LOCK = threading.RLock()
 
 class DockingTool:
     """Tool for computing molecular docking scores"""
     
-    def __init__(self, cache_file="data/docking_scores.json"):
-        self.cache_file = cache_file
+    def __init__(self, db_file="data/docking_scores.db", seed_file="data/docking_scores.json",
+                 surrogate=None, triage_threshold=-6.0):
+        """
+        Args:
+            db_file: SQLite database holding the score cache
+            seed_file: JSON scores imported into an empty database
+            surrogate: Optional fast affinity model used to triage molecules
+                before real docking; a fitted regressor with predict(X) over
+                Morgan fingerprints, or a path to one saved with joblib
+            triage_threshold: Only molecules the surrogate predicts below
+                this score (kcal/mol) are sent to real docking
+        """
+        self.db_file = db_file
+        self.seed_file = seed_file
+        self.surrogate = _load_surrogate(surrogate) if isinstance(surrogate, str) else surrogate
+        self.triage_threshold = triage_threshold
+        self._hot = _SCORE_CACHE.setdefault(db_file, {})
+        
+        os.makedirs(os.path.dirname(self.db_file) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(self.db_file, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS scores("
+            "target TEXT, smiles TEXT, score REAL, ts TEXT, "
+            "PRIMARY KEY(target, smiles))"
+        )
+        self._seed_from_json()
         
     def generate_mock_score(self, smiles):
         """Generate a deterministic mock docking score based on SMILES string."""
-        hash_val = hash(smiles) % 1000
-        score = -3.0 - (hash_val / 1000.0) * 9.0
-        return round(score, 1)
+        return _mock_score(smiles)
+    
+    @staticmethod
+    def is_valid_smiles(smiles):
+        """Check whether RDKit can parse a SMILES string"""
+        return _canon(smiles) is not None
+    
+    def can_dock(self, target_name):
+        """Check whether target_name can be docked for real, rather than with mock scores"""
+        if _dockstring_load_target() is None:
+            return False
+        try:
+            _load_target_cached(target_name)
+        except Exception as e:
+            print(f"Warning: Failed to load target {target_name}: {e}")
+            return False
+        return True
     
-    def compute_scores(self, smiles_list, target_name):
+    def compute_scores(self, smiles_list, target_name, estimated=None):
         """
         Compute docking scores for a list of SMILES strings.
         
         Args:
             smiles_list: List of SMILES strings to dock
             target_name: Name of the protein target
+            estimated: Optional set; input SMILES whose score is a surrogate
+                estimate rather than a docking result are added to it
             
         Returns:
             Dictionary mapping SMILES to docking scores
         """
         print(f"DEBUG: compute_scores called with target={target_name}")
         
-        cache = self._load_cache()
-        if target_name not in cache:
-            cache[target_name] = {}
+        # Canonicalize once so equivalent SMILES share one cache entry and one dock
+        inputs = list(dict.fromkeys(smiles_list))
+        canon_map = {smi: _canon(smi) for smi in inputs}
+        for smi, canon in canon_map.items():
+            if canon is None:
+                print(f"Invalid SMILES: {smi}")
+        
+        # Dedupe in input order so each molecule is looked up and docked once
+        unique = list(dict.fromkeys(canon for canon in canon_map.values() if canon is not None))
+        estimated_canon = set()
+        scored = self._compute_unique(unique, target_name, estimated_canon)
         
-        results = {}
-        cache_modified = False
-        use_real_docking = False
+        if estimated is not None and estimated_canon:
+            estimated.update(smi for smi, canon in canon_map.items() if canon in estimated_canon)
+        return {smi: scored.get(canon) for smi, canon in canon_map.items()}
+    
+    def _compute_unique(self, unique, target_name, estimated):
+        """
+        Scores for a list of unique canonical SMILES: cache hits first, then
+        dock the misses. Molecules only scored by the surrogate are added to
+        the estimated set.
+        """
+        scores = self._cached_subset(set(unique), target_name)
+        misses = []
+        for canon in unique:
+            if canon in scores:
+                print(f"Using cached score for {canon} against {target_name}: {scores[canon]}")
+            else:
+                misses.append(canon)
         
-        # Try to load built-in target
-        if DOCKSTRING_AVAILABLE:
+        if misses:
+            docked, estimates = self._score_misses(misses, target_name)
+            scores.update(docked)
+            scores.update(estimates)
+            estimated.update(estimates)
+        return scores
+    
+    def compute_scores_iter(self, smiles_iter, target_name, chunk=256, estimated=None):
+        """
+        Compute docking scores for a stream of SMILES strings in chunks.
+        
+        Only one chunk is held in memory at a time, and each chunk goes
+        through compute_scores as a batch (estimated is passed along).
+        
+        Yields:
+            (smiles, score) tuples in input order
+        """
+        smiles_iter = iter(smiles_iter)
+        while True:
+            batch = list(itertools.islice(smiles_iter, chunk))
+            if not batch:
+                return
+            scores = self.compute_scores(batch, target_name, estimated)
+            for smi in batch:
+                yield smi, scores[smi]
+    
+    def _score_misses(self, misses, target_name):
+        """
+        Dock (or mock) canonical SMILES missing from the cache and store the results.
+        
+        Returns (scores, estimates): estimates holds the surrogate predictions
+        of molecules triaged away from docking, which are never cached.
+        """
+        target = None
+        
+        # Load the built-in target once for the whole batch of misses
+        if _dockstring_load_target() is not None:
             try:
                 print(f"Loading built-in target: {target_name}")
-                target = load_target(target_name)
-                use_real_docking = True
+                target = _load_target_cached(target_name)
                 print(f"Successfully loaded built-in target: {target_name}")
             except Exception as e:
                 print(f"Warning: Failed to load target {target_name}: {e}")
                 print("Falling back to mock scores")
-                use_real_docking = False
-        else:
-            use_real_docking = False
-        
-        for smi in smiles_list:
-            # Check cache for this specific target-molecule combination
-            if smi in cache[target_name]:
-                results[smi] = cache[target_name][smi]
-                print(f"Using cached score for {smi} against {target_name}: {cache[target_name][smi]}")
-                continue
-            
-            mol = Chem.MolFromSmiles(smi)
-            if mol is None:
-                print(f"Invalid SMILES: {smi}")
-                results[smi] = None
-                continue
-            
-            if use_real_docking:
-                try:
-                    result = target.dock(smi)
-                    # Handle different return formats from dockstring
-                    if isinstance(result, dict):
-                        score = result["score"]
-                    elif isinstance(result, tuple):
-                        score = result[0]
-                    else:
-                        score = float(result)
-                    print(f"Computed docking score for {smi} against {target_name}: {score}")
-                except Exception as e:
-                    print(f"Warning: Docking failed for {smi}: {e}")
-                    print("Using mock score")
-                    score = self.generate_mock_score(smi)
+                target = None
+        
+        if target is None:
+            scores = {smi: self.generate_mock_score(smi) for smi in misses}
+            self._put_many(target_name, scores.items())
+            return scores, {}
+        
+        estimates = {}
+        if self.surrogate is not None:
+            misses, estimates = self._triage(misses, target_name)
+        
+        scores = self._dock_batch(target, target_name, misses) if misses else {}
+        self._put_many(target_name, scores.items())
+        return scores, estimates
+    
+    def _triage(self, smiles_list, target_name):
+        """
+        Split molecules with the surrogate model.
+        
+        Returns the molecules predicted to bind better than triage_threshold,
+        which still need real docking, and a dict of surrogate estimates for
+        the rest.
+        """
+        predictions = self.surrogate.predict(_morgan_matrix(smiles_list))
+        to_dock = []
+        estimates = {}
+        for smi, pred in zip(smiles_list, predictions):
+            if pred < self.triage_threshold:
+                to_dock.append(smi)
             else:
-                score = self.generate_mock_score(smi)
-                
-            results[smi] = score
-            cache[target_name][smi] = score
-            cache_modified = True
+                estimates[smi] = round(float(pred), 1)
+                print(f"Surrogate estimate for {smi} against {target_name}: {estimates[smi]} (not docked)")
+        return to_dock, estimates
+    
+    def get_cached_scores(self, smiles_list, target_name):
+        """Return the cached scores for the molecules in smiles_list that have one"""
+        canon_map = {smi: _canon(smi) for smi in smiles_list}
+        cached = self._cached_subset(set(canon_map.values()), target_name)
+        return {smi: cached[canon] for smi, canon in canon_map.items() if canon in cached}
+    
+    def get_cache_hit_rate(self, smiles_list, target_name):
+        """Fraction of the unique molecules in smiles_list already scored against the target"""
+        unique = {_canon(smi) for smi in smiles_list}
+        unique.discard(None)
+        if not unique:
+            return 0.0
+        return len(self._cached_subset(unique, target_name)) / len(unique)
+    
+    def _cached_subset(self, canon_smiles, target_name):
+        """Cached scores for a set of canonical SMILES, via one set intersection"""
+        with _CACHE_LOCK:
+            target_scores = self._target_scores(target_name)
+            hits = target_scores.keys() & canon_smiles
+            return {canon: target_scores[canon] for canon in hits}
+    
+    def _dock_batch(self, target, target_name, smiles_list):
+        """
+        Dock all cache misses against an already loaded target.
         
-        # Only save cache if it was modified
-        if cache_modified:
-            self._save_cache(cache)
+        Molecules are independent, so a batch is spread over the shared
+        process pool (sized by _dock_workers, bounded across concurrent
+        requests); a single molecule is docked in-process on one core.
+        Molecules whose docking fails fall back to mock scores.
+        """
+        if len(smiles_list) == 1:
+            smi = smiles_list[0]
+            return {smi: self._dock_single(target, target_name, smi)}
         
-        return results
+        pool = _dock_pool()
+        jobs = [(target_name, smi) for smi in smiles_list]
+        try:
+            results = list(pool.map(_dock_one, jobs))
+        except BrokenProcessPool:
+            _discard_dock_pool(pool)
+            raise
+        
+        scores = {}
+        for smi, (score, error) in zip(smiles_list, results):
+            if error is not None:
+                print(f"Warning: Docking failed for {smi}: {error}")
+                print("Using mock score")
+                score = self.generate_mock_score(smi)
+            else:
+                print(f"Computed docking score for {smi} against {target_name}: {score}")
+            scores[smi] = score
+        return scores
     
-    def _load_cache(self):
-        """Load cache from file"""
-        if not os.path.exists(self.cache_file):
-            return {}
+    def _dock_single(self, target, target_name, smi):
+        """Dock a single molecule, falling back to a mock score on failure"""
         try:
-            with open(self.cache_file, 'r') as f:
-                return json.load(f)
+            # One CPU like the pool workers, so this runs beside them without oversubscribing
+            score = _parse_dock_result(target.dock(smi, num_cpus=1))
+            print(f"Computed docking score for {smi} against {target_name}: {score}")
         except Exception as e:
-            print(f"Error loading cache: {e}")
-            return {}
+            print(f"Warning: Docking failed for {smi}: {e}")
+            print("Using mock score")
+            score = self.generate_mock_score(smi)
+        return score
     
-    def _save_cache(self, cache):
-        """Save cache to file"""
+    def _seed_from_json(self):
+        """Import the legacy JSON score file into an empty database"""
+        with _CACHE_LOCK:
+            if self._conn.execute("SELECT 1 FROM scores LIMIT 1").fetchone():
+                return
+        if not os.path.exists(self.seed_file):
+            return
         try:
-            os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
-            with open(self.cache_file, 'w') as f:
-                json.dump(cache, f, indent=2)
+            with open(self.seed_file, 'rb') as f:
+                data = f.read()
+            seed = orjson.loads(data) if orjson is not None else json.loads(data)
         except Exception as e:
-            print(f"Error saving cache: {e}")
\ No newline at end of file
+            print(f"Error loading seed scores: {e}")
+            return
+        
+        for target_name, scores in seed.items():
+            canon_scores = ((_canon(smi), score) for smi, score in scores.items())
+            self._put_many(target_name, [(c, score) for c, score in canon_scores if c is not None])
+    
+    def _target_scores(self, target_name):
+        """Return the in-memory scores for a target, reading them once from the database"""
+        with _CACHE_LOCK:
+            scores = self._hot.get(target_name)
+            if scores is None:
+                rows = self._conn.execute(
+                    "SELECT smiles, score FROM scores WHERE target = ?", (target_name,)
+                )
+                scores = self._hot[target_name] = dict(rows)
+            return scores
+    
+    def _put_many(self, target_name, items):
+        """Store (smiles, score) pairs for a target in a single transaction"""
+        items = list(items)
+        ts = datetime.now().isoformat()
+        with _CACHE_LOCK:
+            try:
+                with self._conn:
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO scores(target, smiles, score, ts) VALUES (?, ?, ?, ?)",
+                        [(target_name, smi, score, ts) for smi, score in items],
+                    )
+            except sqlite3.Error as e:
+                print(f"Error saving cache: {e}")
+            
+            scores = self._hot.get(target_name)
+            if scores is not None:
+                scores.update(items)
@@ -1,12 +1,229 @@
-import json
 import os
+import re
+import sys
+from bisect import bisect_right
+from functools import lru_cache
+from typing import NamedTuple
+
+import numpy as np
+
+from . import _knowledge_kernels
+
+# orjson parses the knowledge base several times faster, stdlib json is the fallback
+try:
+    import orjson as _json
+except ImportError:
+    import json as _json
+
+# With ijson each subtree is streamed out of the file on its own, so the
+# whole knowledge base never has to be held in memory at once
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+# Upper bounds (exclusive) of the score bands, ascending, and their categories.
+# The edges are shared read-only by every batch helper; the tuple copy serves
+# single scores, where bisect beats a NumPy call.
+_BIN_EDGES = np.array([-8.0, -6.0, -4.0], dtype=np.float64)
+_BIN_EDGES.setflags(write=False)
+_SCORE_THRESHOLDS = tuple(_BIN_EDGES.tolist())
+_CATEGORY_NAMES = ("excellent", "good", "moderate", "weak")
+
+# Keyword routing for answer_general_question, highest priority first
+_ROUTES = (
+    ("docking", ("docking", "molecular docking")),
+    ("virtual_screening", ("virtual screening", "screening")),
+    ("drug_discovery", ("drug discovery", "drug development")),
+    ("scoring", ("score", "binding", "affinity")),
+)
+_ROUTE_PRIORITY = {category: i for i, (category, _) in enumerate(_ROUTES)}
+
+# Scan the question once for every keyword: an Aho-Corasick automaton when
+# pyahocorasick is installed, otherwise one regex alternation
+try:
+    import ahocorasick
+    
+    _ROUTER = ahocorasick.Automaton()
+    for _category, _keywords in _ROUTES:
+        for _keyword in _keywords:
+            _ROUTER.add_word(_keyword, _category)
+    _ROUTER.make_automaton()
+except ImportError:
+    _ROUTER = None
+
+_ROUTER_RE = re.compile("|".join(
+    f"(?P<{category}>{'|'.join(sorted(map(re.escape, keywords), key=len, reverse=True))})"
+    for category, keywords in _ROUTES
+))
+
+def _route(question_folded):
+    """Category of the highest-priority keyword in a casefolded question, or None"""
+    if _ROUTER is not None:
+        matches = (category for _, category in _ROUTER.iter(question_folded))
+    else:
+        matches = (match.lastgroup for match in _ROUTER_RE.finditer(question_folded))
+    
+    best = None
+    for category in matches:
+        if best is None or _ROUTE_PRIORITY[category] < _ROUTE_PRIORITY[best]:
+            best = category
+            if _ROUTE_PRIORITY[best] == 0:
+                # nothing can outrank the first route, stop scanning
+                break
+    return best
+
+class ScoreInterpretation(NamedTuple):
+    """Result of KnowledgeTool.get_score_interpretation"""
+    score: float
+    category: str
+    range: str
+    description: str
+    recommendation: str
+
+# Returned by get_target_info for ids missing from the knowledge base
+_UNKNOWN_TARGET = {
+    "name": None,
+    "description": "No information available",
+    "drug_examples": (),
+    "binding_site": "Unknown",
+    "therapeutic_area": "Unknown"
+}
+
+# Static answers of answer_general_question, built once at import
+_SCORE_HELP = """**Docking Score Interpretation:**
+
+• **Excellent binding**: < -8.0 kcal/mol (Very strong binding, potential drug candidate)
+• **Good binding**: -6.0 to -8.0 kcal/mol (Good binding affinity, worth further investigation)
+• **Moderate binding**: -4.0 to -6.0 kcal/mol (Moderate binding, may need optimization)
+• **Weak binding**: > -4.0 kcal/mol (Weak binding, unlikely to be effective)
+
+More negative scores indicate stronger binding affinity. Differences of 1-2 kcal/mol can represent 10-fold differences in binding strength."""
+
+_GENERAL_HELP = """I can help with questions about:
+
+• **Molecular docking** - How docking works and interprets results
+• **Virtual screening** - High-throughput compound screening
+• **Drug discovery** - The drug development process
+• **Binding scores** - Interpreting docking scores and binding affinity
+• **Protein targets** - Information about specific targets like F2, 3CLP, etc.
+• **Molecular properties** - Drug-likeness and ADMET properties
+
+What would you like to know more about?"""
+
+# Answers for process questions, filled from the knowledge base
+_PROCESS_TEMPLATES = {
+    "docking": "**Molecular Docking**\n\n{description}\n\n**Steps:**\n{steps}",
+    "virtual_screening": "**Virtual Screening**\n\n{description}\n\n**Steps:**\n{steps}",
+    "drug_discovery": "**Drug Discovery**\n\n{description}\n\n**Stages:**\n{stages}\n\n**Timeline:** {timeline}",
+}
+
+def _bullets(items):
+    return "\n".join(f"• {item}" for item in items)
 
 class KnowledgeTool:
     """Tool for providing domain knowledge and explanations"""
     
+    # Slots instead of a per-instance __dict__. The knowledge base and its
+    # subtrees stay lazy: reading an unset slot falls through to __getattr__,
+    # which loads the value once and stores it in the slot.
+    __slots__ = (
+        "knowledge_file",
+        "knowledge_base",
+        "_scores",
+        "_targets",
+        "_drug_lists",
+        "_processes",
+        "_properties",
+        "_process_answers",
+        "_explain_process_cached",
+        "_property_info_cached",
+        "_answer_cached",
+    )
+    
+    _LOADERS = {
+        "knowledge_base": "_load_knowledge_base",
+        "_scores": "_load_scores",
+        "_targets": "_load_targets",
+        "_drug_lists": "_load_drug_lists",
+        "_processes": "_load_processes",
+        "_properties": "_load_properties",
+        "_process_answers": "_load_process_answers",
+    }
+    
     def __init__(self, knowledge_file="data/docking_knowledge.json"):
         self.knowledge_file = knowledge_file
-        self.knowledge_base = self._load_knowledge_base()
+        
+        # The knowledge base is read-only once loaded, so lookups by name are memoized
+        self._explain_process_cached = lru_cache(maxsize=64)(self._explain_process)
+        self._property_info_cached = lru_cache(maxsize=64)(self._get_molecular_property_info)
+        self._answer_cached = lru_cache(maxsize=256)(self._answer_general_question)
+    
+    def __getattr__(self, name):
+        """Only reached for unset slots: load lazy attributes on first access"""
+        loader = self._LOADERS.get(name)
+        if loader is None:
+            raise AttributeError(f"{type(self).__name__!r} object has no attribute {name!r}")
+        value = getattr(self, loader)()
+        setattr(self, name, value)
+        return value
+    
+    # Subtrees are bound once instead of re-fetched on every call
+    
+    def _load_scores(self):
+        return self._subtree("docking_scores")
+    
+    def _load_targets(self):
+        # Annotate each target once so get_target_info needs no per-call work
+        return {
+            target_id: {
+                **info,
+                "drug_examples": tuple(info.get("drug_examples", ())),
+                "target_id": target_id,
+                "has_known_drugs": bool(info.get("drug_examples")),
+            }
+            for target_id, info in self._subtree("targets").items()
+        }
+    
+    def _load_drug_lists(self):
+        """Known drugs of each target, pre-joined for display"""
+        return {target_id: ", ".join(info["drug_examples"]) for target_id, info in self._targets.items()}
+    
+    def _load_processes(self):
+        return self._subtree("processes")
+    
+    def _load_properties(self):
+        return self._subtree("molecular_properties")
+    
+    def _load_process_answers(self):
+        """Answers to process questions, formatted once so answering is a lookup"""
+        answers = {}
+        for process, template in _PROCESS_TEMPLATES.items():
+            process_info = self._processes.get(process)
+            if process_info:
+                answers[process] = template.format(
+                    description=process_info.get("description"),
+                    steps=_bullets(process_info.get("steps", ())),
+                    stages=_bullets(process_info.get("stages", ())),
+                    timeline=process_info.get("timeline"),
+                )
+        return answers
+    
+    def _subtree(self, section):
+        """A top-level section of the knowledge base, with its keys interned"""
+        return {sys.intern(key): value for key, value in self._load_section(section).items()}
+    
+    def _load_section(self, section):
+        """Parse one top-level section, streaming it from the file when ijson is available"""
+        if ijson is None or not os.path.exists(self.knowledge_file):
+            return self.knowledge_base.get(section, {})
+        
+        try:
+            with open(self.knowledge_file, 'rb') as f:
+                return next(ijson.items(f, section, use_float=True), {})
+        except Exception as e:
+            print(f"Error loading knowledge base section {section}: {e}")
+            return {}
     
     def _load_knowledge_base(self):
         """Load knowledge base from JSON file"""
@@ -15,56 +232,65 @@ class KnowledgeTool:
             return {}
         
         try:
-            with open(self.knowledge_file, 'r') as f:
-                return json.load(f)
+            with open(self.knowledge_file, 'rb') as f:
+                return _json.loads(f.read())
         except Exception as e:
             print(f"Error loading knowledge base: {e}")
             return {}
     
     def get_score_interpretation(self, score):
         """Interpret docking score and provide detailed analysis"""
-        if score < -8.0:
-            category = "excellent"
-        elif score < -6.0:
-            category = "good"
-        elif score < -4.0:
-            category = "moderate"
-        else:
-            category = "weak"
-        
-        interpretation = self.knowledge_base.get("docking_scores", {}).get(category, {})
-        return {
-            "score": score,
-            "category": category,
-            "range": interpretation.get("range", "Unknown"),
-            "description": interpretation.get("description", "No description available"),
-            "recommendation": interpretation.get("recommendation", "No specific recommendation available")
-        }
+        category = _CATEGORY_NAMES[bisect_right(_SCORE_THRESHOLDS, score)]
+        return self._interpretation(score, category)
+    
+    def get_score_interpretations_batch(self, scores):
+        """Interpret a sequence of docking scores, categorizing them in one vectorized pass"""
+        scores = np.asarray(scores, dtype=np.float64)
+        indices = np.searchsorted(_BIN_EDGES, scores, side="right")
+        return [
+            self._interpretation(score, _CATEGORY_NAMES[idx])
+            for score, idx in zip(scores.tolist(), indices.tolist())
+        ]
+    
+    def _interpretation(self, score, category):
+        """Build the interpretation of a score for an already computed category"""
+        interpretation = self._scores.get(category, {})
+        return ScoreInterpretation(
+            score,
+            category,
+            interpretation.get("range", "Unknown"),
+            interpretation.get("description", "No description available"),
+            interpretation.get("recommendation", "No specific recommendation available")
+        )
     
     def get_target_info(self, target_id):
         """Get comprehensive information about a protein target"""
-        targets = self.knowledge_base.get("targets", {})
-        target_info = targets.get(target_id, {
-            "name": f"Unknown target {target_id}",
-            "description": "No information available",
-            "drug_examples": [],
-            "binding_site": "Unknown",
-            "therapeutic_area": "Unknown"
-        })
-        
-        # additional context
+        target_info = self._targets.get(target_id)
+        if target_info is None:
+            return self._unknown_target(target_id)
+        # copy so callers can never modify the knowledge base
+        return target_info.copy()
+    
+    def _unknown_target(self, target_id):
+        target_info = _UNKNOWN_TARGET.copy()
+        target_info["name"] = f"Unknown target {target_id}"
         target_info["target_id"] = target_id
-        target_info["has_known_drugs"] = len(target_info.get("drug_examples", [])) > 0
-        
+        target_info["has_known_drugs"] = False
         return target_info
     
+    def get_target_ids(self):
+        """List the target ids present in the knowledge base"""
+        return list(self._targets)
+    
     def explain_process(self, process):
         """Explain a scientific process with detailed information"""
-        processes = self.knowledge_base.get("processes", {})
-        process_info = processes.get(process.lower())
+        return self._explain_process_cached(process)
+    
+    def _explain_process(self, process):
+        process_info = self._processes.get(process.lower())
         
         if not process_info:
-            available_processes = list(processes.keys())
+            available_processes = list(self._processes.keys())
             return {
                 "error": f"Unknown process: {process}",
                 "available_processes": available_processes
@@ -74,30 +300,42 @@ class KnowledgeTool:
     
     def get_molecular_property_info(self, property_name):
         """Get information about molecular properties"""
-        properties = self.knowledge_base.get("molecular_properties", {})
-        return properties.get(property_name.lower(), {
+        return self._property_info_cached(property_name)
+    
+    def _get_molecular_property_info(self, property_name):
+        return self._properties.get(property_name.lower(), {
             "error": f"Unknown property: {property_name}",
-            "available_properties": list(properties.keys())
+            "available_properties": list(self._properties.keys())
         })
     
     def get_analysis_insights(self, results, target=None):
-        """Generate comprehensive insights from docking results"""
+        """Generate comprehensive insights from docking results, as one markdown string"""
         insights = []
         
         if not results:
-            return ["No results to analyze"]
+            return "No results to analyze"
+        
+        # one pass over the results, skipping molecules without a score
+        mols = []
+        values = []
+        for mol, score in results.items():
+            if score is not None:
+                mols.append(mol)
+                values.append(score)
+        if not mols:
+            return "No valid scores found"
         
-        valid_scores = [score for score in results.values() if score is not None]
-        if not valid_scores:
-            return ["No valid scores found"]
+        scores = np.array(values, dtype=np.float64)
         
-        # basic statistics
-        best_score = min(valid_scores)
-        worst_score = max(valid_scores)
-        avg_score = sum(valid_scores) / len(valid_scores)
+        # basic statistics and band counts (in _CATEGORY_NAMES order) in one pass
+        best_score, worst_score, best_idx, counts = _knowledge_kernels.bucket_and_stats(
+            scores, _BIN_EDGES
+        )
+        # left-to-right sum, pairwise or reordered sums can round the average differently
+        avg_score = sum(values) / len(values)
         score_range = worst_score - best_score
         
-        best_mol = [mol for mol, score in results.items() if score == best_score][0]
+        best_mol = mols[best_idx]
         
         insights.append(f"## Analysis Summary")
         insights.append(f"Best binding: {best_mol} ({best_score:.1f} kcal/mol)")
@@ -105,27 +343,24 @@ class KnowledgeTool:
         insights.append(f"Score range: {score_range:.1f} kcal/mol")
         
         # score distribution analysis
-        excellent = [score for score in valid_scores if score < -8.0]
-        good = [score for score in valid_scores if -8.0 <= score < -6.0]
-        moderate = [score for score in valid_scores if -6.0 <= score < -4.0]
-        weak = [score for score in valid_scores if score >= -4.0]
+        excellent, good, moderate, weak = counts.tolist()
         
         insights.append(f"\n## Binding Affinity Distribution")
         if excellent:
-            insights.append(f"• {len(excellent)} compound(s) show excellent binding (< -8.0 kcal/mol)")
+            insights.append(f"• {excellent} compound(s) show excellent binding (< -8.0 kcal/mol)")
         if good:
-            insights.append(f"• {len(good)} compound(s) show good binding (-6.0 to -8.0 kcal/mol)")
+            insights.append(f"• {good} compound(s) show good binding (-6.0 to -8.0 kcal/mol)")
         if moderate:
-            insights.append(f"• {len(moderate)} compound(s) show moderate binding (-4.0 to -6.0 kcal/mol)")
+            insights.append(f"• {moderate} compound(s) show moderate binding (-4.0 to -6.0 kcal/mol)")
         if weak:
-            insights.append(f"• {len(weak)} compound(s) show weak binding (> -4.0 kcal/mol)")
+            insights.append(f"• {weak} compound(s) show weak binding (> -4.0 kcal/mol)")
         
         # target-specific insights
         if target:
-            target_info = self.get_target_info(target)
-            if target_info["has_known_drugs"]:
+            target_info = self._targets.get(target)
+            if target_info is not None and target_info["has_known_drugs"]:
                 insights.append(f"\n## Target Context: {target_info['name']}")
-                insights.append(f"Known drugs: {', '.join(target_info['drug_examples'])}")
+                insights.append(f"Known drugs: {self._drug_lists[target]}")
                 insights.append(f"Therapeutic area: {target_info['therapeutic_area']}")
         
         # recommendations
@@ -148,49 +383,17 @@ class KnowledgeTool:
             insights.append("• Similar binding affinities across compounds")
             insights.append("• Consider additional screening criteria")
         
-        return insights
+        return "\n".join(insights)
     
     def answer_general_question(self, question):
         """Answer general questions about molecular docking and drug discovery"""
-        question_lower = question.lower()
-        
-        if any(word in question_lower for word in ["docking", "molecular docking"]):
-            process_info = self.explain_process("docking")
-            if "error" not in process_info:
-                return f"**Molecular Docking**\n\n{process_info['description']}\n\n**Steps:**\n" + \
-                       "\n".join([f"• {step}" for step in process_info['steps']])
-        
-        elif any(word in question_lower for word in ["virtual screening", "screening"]):
-            process_info = self.explain_process("virtual_screening")
-            if "error" not in process_info:
-                return f"**Virtual Screening**\n\n{process_info['description']}\n\n**Steps:**\n" + \
-                       "\n".join([f"• {step}" for step in process_info['steps']])
-        
-        elif any(word in question_lower for word in ["drug discovery", "drug development"]):
-            process_info = self.explain_process("drug_discovery")
-            if "error" not in process_info:
-                return f"**Drug Discovery**\n\n{process_info['description']}\n\n**Stages:**\n" + \
-                       "\n".join([f"• {stage}" for stage in process_info['stages']]) + \
-                       f"\n\n**Timeline:** {process_info['timeline']}"
-        
-        elif any(word in question_lower for word in ["score", "binding", "affinity"]):
-            return """**Docking Score Interpretation:**
-
-• **Excellent binding**: < -8.0 kcal/mol (Very strong binding, potential drug candidate)
-• **Good binding**: -6.0 to -8.0 kcal/mol (Good binding affinity, worth further investigation)
-• **Moderate binding**: -4.0 to -6.0 kcal/mol (Moderate binding, may need optimization)
-• **Weak binding**: > -4.0 kcal/mol (Weak binding, unlikely to be effective)
-
-More negative scores indicate stronger binding affinity. Differences of 1-2 kcal/mol can represent 10-fold differences in binding strength."""
+        return self._answer_cached(question)
+    
+    def _answer_general_question(self, question):
+        category = _route(question.casefold())
         
-        else:
-            return """I can help with questions about:
-
-• **Molecular docking** - How docking works and interprets results
-• **Virtual screening** - High-throughput compound screening
-• **Drug discovery** - The drug development process
-• **Binding scores** - Interpreting docking scores and binding affinity
-• **Protein targets** - Information about specific targets like F2, 3CLP, etc.
-• **Molecular properties** - Drug-likeness and ADMET properties
-
-What would you like to know more about?"""
\ No newline at end of file
+        if category is None:
+            return _GENERAL_HELP
+        if category == "scoring":
+            return _SCORE_HELP
+        return self._process_answers.get(category)